@@ -1,23 +1,34 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 import os
+import re
+import asyncio
 import logging
-import json
 import sqlite3
 from datetime import datetime
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
 
+import aiosqlite
 from aiogram import Bot, Dispatcher, types
-from aiogram.contrib.middlewares.logging import LoggingMiddleware
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.contrib.fsm_storage.files import JSONStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils import executor
 
+# uvloop حلقه‌ی رویداد را سریع‌تر می‌کند؛ نبودنش (مثلاً در ویندوز) مشکلی ندارد
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 # تنظیمات لاگ
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# قالب توکن BotFather: آیدی عددی، دونقطه، رشته‌ی محرمانه
+TOKEN_RE = re.compile(r'^\d{6,12}:[A-Za-z0-9_-]{30,}$')
+
 # حالت‌های مکالمه
 class Form(StatesGroup):
     waiting_token = State()
@@ -25,9 +36,58 @@ class Form(StatesGroup):
 
 # ==================== دیتابیس ====================
 
+DB_PATH = 'war_game.db'
+POOL_SIZE = 4
+SCHEMA_VERSION = 1
+
+# تنظیمات کارایی SQLite: WAL اجازه می‌دهد خواندن‌ها پشت نوشتن‌ها گیر نکنند
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+# استخر اتصال‌های aiosqlite؛ در on_startup پر می‌شود
+_pool: asyncio.Queue = asyncio.Queue()
+
+async def init_pool():
+    """ایجاد اتصال‌های دائمی برای هندلرها (به جای باز/بسته کردن در هر کلیک)"""
+    for _ in range(POOL_SIZE):
+        conn = await aiosqlite.connect(DB_PATH, cached_statements=256)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        _pool.put_nowait(conn)
+
+async def close_pool():
+    while not _pool.empty():
+        conn = _pool.get_nowait()
+        await conn.close()
+
+@asynccontextmanager
+async def acquire():
+    """دریافت یک اتصال از استخر و بازگرداندن آن پس از اتمام کار"""
+    conn = await _pool.get()
+    try:
+        yield conn
+        await conn.commit()
+    except Exception:
+        await conn.rollback()
+        raise
+    finally:
+        _pool.put_nowait(conn)
+
+# متن‌های SQL پرتکرار؛ ثابت بودن رشته یعنی هر بار از کش statement استفاده می‌شود
+SQL_LIST_BOTS = "SELECT id, substr(created_at, 1, 10) FROM bots WHERE owner_id = ? ORDER BY id DESC LIMIT 50"
+SQL_INSERT_BOT = "INSERT INTO bots (token, owner_id) VALUES (?, ?) ON CONFLICT(token) DO NOTHING"
+
 @contextmanager
 def get_db_connection():
-    conn = sqlite3.connect('war_game.db', check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -41,7 +101,14 @@ def get_db_connection():
 def init_database():
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        
+
+        for pragma in PRAGMAS:
+            cursor.execute(pragma)
+
+        # اگر اسکیما قبلاً ساخته شده، از اجرای دوباره‌ی DDL صرف‌نظر کن
+        if cursor.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            return
+
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS bots (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,13 +123,40 @@ def init_database():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             bot_id INTEGER NOT NULL,
-            resources TEXT DEFAULT '{"money": 10000}',
+            money INTEGER NOT NULL DEFAULT 10000,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
         ''')
 
+        # ایندکس برای جستجوهای پرتکرار؛ بدون آن‌ها SQLite کل جدول را اسکن می‌کند
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bots_owner ON bots(owner_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_user_bot ON users(user_id, bot_id)')
+
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
 init_database()
 
+# ==================== متن‌های ثابت ====================
+
+# یک بار در زمان import ساخته می‌شوند، نه در هر پیام
+START_TEMPLATE = (
+    "👑 سلام {name}!\n"
+    "به ربات مادر بازی استراتژیک خوش آمدید.\n\n"
+    "📋 دستورات:\n"
+    "/addbot - ایجاد ربات فرزند\n"
+    "/listbots - نمایش ربات‌ها\n"
+    "/help - راهنمای کامل"
+)
+
+HELP_TEXT = (
+    "📚 راهنمای ربات مادر\n\n"
+    "🛠 دستورات:\n"
+    "• /start - شروع ربات\n"
+    "• /addbot - ایجاد ربات فرزند\n"
+    "• /listbots - نمایش ربات‌ها\n"
+    "• /help - این راهنما"
+)
+
 # ==================== ربات ====================
 
 # دریافت توکن
@@ -71,54 +165,36 @@ if not MOTHER_TOKEN:
     raise ValueError("MOTHER_BOT_TOKEN not set!")
 
 bot = Bot(token=MOTHER_TOKEN)
-storage = MemoryStorage()
+# ذخیره‌ی وضعیت مکالمه روی دیسک تا /addbot نیمه‌کاره با ری‌استارت از بین نرود
+storage = JSONStorage('fsm_storage.json')
 dp = Dispatcher(bot, storage=storage)
-dp.middleware.setup(LoggingMiddleware())
 
 # ==================== هندلرها ====================
 
 @dp.message_handler(commands=['start'])
 async def cmd_start(message: types.Message):
-    await message.reply(
-        f"👑 سلام {message.from_user.first_name}!\n"
-        f"به ربات مادر بازی استراتژیک خوش آمدید.\n\n"
-        f"📋 دستورات:\n"
-        f"/addbot - ایجاد ربات فرزند\n"
-        f"/listbots - نمایش ربات‌ها\n"
-        f"/help - راهنمای کامل"
-    )
+    await message.reply(START_TEMPLATE.format(name=message.from_user.first_name))
 
 @dp.message_handler(commands=['help'])
 async def cmd_help(message: types.Message):
-    await message.reply(
-        "📚 راهنمای ربات مادر\n\n"
-        "🛠 دستورات:\n"
-        "• /start - شروع ربات\n"
-        "• /addbot - ایجاد ربات فرزند\n"
-        "• /listbots - نمایش ربات‌ها\n"
-        "• /help - این راهنما"
-    )
+    await message.reply(HELP_TEXT)
 
 @dp.message_handler(commands=['listbots'])
 async def cmd_listbots(message: types.Message):
     user_id = message.from_user.id
-    
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id, created_at FROM bots WHERE owner_id = ?",
-            (user_id,)
-        )
-        bots = cursor.fetchall()
+
+    async with acquire() as conn:
+        # فقط جدیدترین‌ها؛ پیام تلگرام محدودیت ۴۰۹۶ کاراکتری دارد
+        async with conn.execute(SQL_LIST_BOTS, (user_id,)) as cursor:
+            bots = await cursor.fetchall()
     
     if not bots:
         await message.reply("🤖 شما هیچ ربات فرزندی ندارید.")
         return
     
-    text = "📋 ربات‌های شما:\n\n"
-    for bot_row in bots:
-        text += f"🔹 ربات #{bot_row['id']}\n📅 {bot_row['created_at'][:10]}\n\n"
-    
+    lines = [f"🔹 ربات #{bot_id}\n📅 {created_day}" for bot_id, created_day in bots]
+    text = "📋 ربات‌های شما:\n\n" + "\n\n".join(lines)
+
     await message.reply(text)
 
 @dp.message_handler(commands=['addbot'])
@@ -132,8 +208,8 @@ async def cmd_addbot(message: types.Message):
 @dp.message_handler(state=Form.waiting_token)
 async def process_token(message: types.Message, state: FSMContext):
     token = message.text.strip()
-    
-    if ':' not in token:
+
+    if not TOKEN_RE.match(token):
         await message.reply("❌ توکن نامعتبر! دوباره ارسال کنید:")
         return
     
@@ -160,36 +236,45 @@ async def process_owner_id(message: types.Message, state: FSMContext):
         await state.finish()
         return
     
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
+    async with acquire() as conn:
         try:
-            cursor.execute(
-                "INSERT INTO bots (token, owner_id) VALUES (?, ?)",
-                (token, owner_id)
-            )
-            bot_id = cursor.lastrowid
-            
-            await message.reply(
-                f"🎉 ربات ایجاد شد!\n\n"
-                f"🔑 شناسه: {bot_id}\n"
-                f"👤 مالک: {owner_id}\n\n"
-                f"✅ اکنون می‌توانید بازی کنید!"
-            )
-            
-        except sqlite3.IntegrityError:
-            await message.reply("❌ این توکن قبلاً ثبت شده است!")
+            # توکن تکراری را بدون هزینه‌ی استثنا نادیده بگیر
+            cursor = await conn.execute(SQL_INSERT_BOT, (token, owner_id))
+
+            if cursor.rowcount == 0:
+                await message.reply("❌ این توکن قبلاً ثبت شده است!")
+            else:
+                bot_id = cursor.lastrowid
+
+                await message.reply(
+                    f"🎉 ربات ایجاد شد!\n\n"
+                    f"🔑 شناسه: {bot_id}\n"
+                    f"👤 مالک: {owner_id}\n\n"
+                    f"✅ اکنون می‌توانید بازی کنید!"
+                )
+
         except Exception as e:
-            logger.error(f"خطا: {e}")
+            logger.error("خطا: %s", e)
             await message.reply(f"❌ خطا: {str(e)}")
     
     await state.finish()
 
 # ==================== اجرا ====================
 
+BOT_COMMANDS = [
+    types.BotCommand('start', 'شروع ربات'),
+    types.BotCommand('addbot', 'ایجاد ربات فرزند'),
+    types.BotCommand('listbots', 'نمایش ربات‌ها'),
+    types.BotCommand('help', 'راهنمای کامل'),
+]
+
 async def on_startup(dp):
+    await init_pool()
+    await bot.set_my_commands(BOT_COMMANDS)
     logger.info("🚀 ربات مادر شروع به کار کرد")
 
 async def on_shutdown(dp):
+    await close_pool()
     logger.info("👋 ربات مادر متوقف شد")
 
 if __name__ == '__main__':
@@ -199,13 +284,14 @@ if __name__ == '__main__':
     
     if WEBHOOK_URL:
         # حالت وب‌هوک برای Render
-        from aiogram.utils.executor import start_webhook
-        
         async def on_startup_webhook(dp):
-            await bot.set_webhook(f"{WEBHOOK_URL}/webhook")
-            logger.info(f"Webhook set to: {WEBHOOK_URL}/webhook")
+            await init_pool()
+            await bot.set_my_commands(BOT_COMMANDS)
+            # فقط پیام‌ها؛ انواع آپدیت بلااستفاده اصلاً ارسال نشوند
+            await bot.set_webhook(f"{WEBHOOK_URL}/webhook", allowed_updates=['message'])
+            logger.info("Webhook set to: %s/webhook", WEBHOOK_URL)
         
-        start_webhook(
+        executor.start_webhook(
             dispatcher=dp,
             webhook_path='/webhook',
             on_startup=on_startup_webhook,
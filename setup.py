@@ -2,7 +2,6 @@
 import os
 import sys
 import sqlite3
-import json
 
 def setup_database():
     """تنظیم اولیه دیتابیس"""
@@ -20,8 +19,24 @@ def setup_database():
     )
     ''')
     
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ai_countries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bot_id INTEGER NOT NULL,
+        country_name TEXT NOT NULL,
+        personality TEXT NOT NULL,
+        money INTEGER NOT NULL DEFAULT 20000,
+        oil INTEGER NOT NULL DEFAULT 1000,
+        electricity INTEGER NOT NULL DEFAULT 1500,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
     # ایجاد سایر جداول...
-    
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bots_owner ON bots(owner_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ai_countries_bot ON ai_countries(bot_id)')
+
     conn.commit()
     conn.close()
     
@@ -39,12 +54,17 @@ def create_sample_ai():
         ("آلمان 🤖", "neutral"),
     ]
     
-    for country, personality in ai_countries:
-        cursor.execute('''
-        INSERT INTO ai_countries (bot_id, country_name, personality, resources)
-        VALUES (?, ?, ?, ?)
-        ''', (1, country, personality, json.dumps({"money": 20000, "oil": 1000, "electricity": 1500})))
-    
+    # همه درج‌ها در یک تراکنش: یک fsync به جای یکی برای هر کشور
+    rows = [
+        (1, country, personality, 20000, 1000, 1500)
+        for country, personality in ai_countries
+    ]
+    cursor.execute("BEGIN")
+    cursor.executemany('''
+    INSERT INTO ai_countries (bot_id, country_name, personality, money, oil, electricity)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', rows)
+
     conn.commit()
     conn.close()
     